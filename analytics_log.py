@@ -0,0 +1,138 @@
+"""Append-only, batched Parquet log of analyses and clinical reports
+
+`log()` only puts a dict on a queue; a background thread groups records
+into row groups and appends them to the current Parquet file, rolling
+over to a new file by size or age. Nothing on the Streamlit request path
+touches the disk.
+
+Files land in analytics/ as predictions-<start time>-<pid>.parquet and
+can be read together with pyarrow.dataset / pandas.read_parquet. The
+file being written is finalized on rollover or process exit.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import bone_model
+
+# ===================== SETTINGS =====================
+DEFAULT_LOG_DIR = os.path.join(bone_model.BASE_DIR, "analytics")
+BATCH_SIZE = 256               # records per row group
+FLUSH_SECONDS = 5.0            # max wait before a partial batch is written
+ROLL_BYTES = 64 * 2**20        # start a new file past this size...
+ROLL_SECONDS = 60 * 60         # ...or after this long
+
+SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("ms")),
+    ("event", pa.string()),            # "analysis" or "report"
+    ("source", pa.string()),           # "browser", "server", "worklist" or "report"
+    ("input_hash", pa.string()),
+    ("model_version", pa.string()),
+    ("probabilities", pa.list_(pa.float32())),
+    ("gender", pa.string()),
+    ("age", pa.float32()),
+    ("bone_age", pa.float32()),
+    ("bone_age_diff", pa.float32()),
+    ("height_percentile", pa.string()),
+    ("weight_percentile", pa.string()),
+    ("height_velocity", pa.float32()),
+    ("weight_velocity", pa.float32()),
+    ("risk_level", pa.string()),
+])
+
+# ===================== WRITER =====================
+class AnalyticsLog:
+    """Asynchronous batched writer with size/time rollover"""
+
+    def __init__(self, log_dir=DEFAULT_LOG_DIR, batch_size=BATCH_SIZE, flush_seconds=FLUSH_SECONDS,
+                 roll_bytes=ROLL_BYTES, roll_seconds=ROLL_SECONDS):
+        self.log_dir = log_dir
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.roll_bytes = roll_bytes
+        self.roll_seconds = roll_seconds
+        self._queue = queue.Queue()
+        self._writer = None
+        self._path = None
+        self._opened_at = 0.0
+        self.dropped = 0
+        os.makedirs(log_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, event, **fields):
+        """Queue one record; never blocks and never raises on the request path"""
+        record = {name: fields.get(name) for name in SCHEMA.names}
+        record["timestamp"] = datetime.now()
+        record["event"] = event
+        if record["probabilities"] is not None:
+            record["probabilities"] = [float(p) for p in record["probabilities"]]
+        self._queue.put_nowait(record)
+
+    def _open(self):
+        """Start a new Parquet file"""
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self._path = os.path.join(self.log_dir, f"predictions-{stamp}-{os.getpid()}.parquet")
+        self._writer = pq.ParquetWriter(self._path, SCHEMA, compression="zstd")
+        self._opened_at = time.monotonic()
+
+    def _roll_if_needed(self):
+        """Finalize the current file once it is too large or too old"""
+        if self._writer is None:
+            return
+        too_big = os.path.getsize(self._path) >= self.roll_bytes
+        too_old = time.monotonic() - self._opened_at >= self.roll_seconds
+        if too_big or too_old:
+            self._writer.close()
+            self._writer = None
+
+    def _write(self, batch):
+        """Append one row group"""
+        if self._writer is None:
+            self._open()
+        self._writer.write_table(pa.Table.from_pylist(batch, schema=SCHEMA))
+        self._roll_if_needed()
+
+    def _run(self):
+        """Collect records into batches and write them off the request path"""
+        batch = []
+        deadline = time.monotonic() + self.flush_seconds
+        while True:
+            try:
+                record = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                record = None
+            if record is _STOP:
+                break
+            if record is not None:
+                batch.append(record)
+            if len(batch) >= self.batch_size or (batch and time.monotonic() >= deadline):
+                try:
+                    self._write(batch)
+                except (OSError, pa.ArrowException):
+                    self.dropped += len(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                self._roll_if_needed()  # time-based rollover even when traffic stops
+                deadline = time.monotonic() + self.flush_seconds
+        if batch:
+            self._write(batch)
+
+    def close(self):
+        """Flush pending records and finalize the open file"""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+_STOP = object()
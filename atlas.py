@@ -0,0 +1,134 @@
+"""Reference-atlas similarity search over bone-age model embeddings
+
+Build the index offline from a CSV manifest of reference radiographs:
+
+    python atlas.py references.csv --out atlas_index
+
+The manifest needs `path` and `bone_age` columns (an optional `gender`
+column lets queries match the patient's sex). Paths are relative to the
+manifest file. The index records the model version whose embeddings it
+holds; it is only comparable with features from that same version.
+"""
+import argparse
+import csv
+import json
+import os
+import numpy as np
+from PIL import Image
+
+import bone_model
+import model_registry
+
+# ===================== INDEX FILES =====================
+DEFAULT_INDEX_DIR = os.path.join(bone_model.BASE_DIR, "atlas_index")
+EMBEDDINGS_FILE = "embeddings.npy"
+REFERENCES_FILE = "references.json"
+
+# ===================== BUILD (OFFLINE) =====================
+def read_manifest(manifest_path):
+    """Read reference rows (path, bone_age, gender) from a CSV manifest"""
+    root = os.path.dirname(os.path.abspath(manifest_path))
+    references = []
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            references.append({
+                "path": os.path.join(root, row["path"]),
+                "bone_age": float(row["bone_age"]),
+                "gender": row.get("gender") or None,
+            })
+    return references
+
+def build_index(manifest_path, index_dir=DEFAULT_INDEX_DIR, batch_size=32):
+    """Embed every reference image and write a memory-mappable index
+
+    Embeddings are L2-normalized and stored as float32, so cosine
+    similarity is a single matrix product straight off the memory map
+    with no per-query conversion; 50,000 references take about 256 MB.
+    """
+    model_version, model = model_registry.load_active()
+    references = read_manifest(manifest_path)
+    os.makedirs(index_dir, exist_ok=True)
+
+    embeddings = np.lib.format.open_memmap(
+        os.path.join(index_dir, EMBEDDINGS_FILE), mode="w+",
+        dtype=np.float32, shape=(len(references), bone_model.FEATURE_DIM)
+    )
+    for start in range(0, len(references), batch_size):
+        batch = references[start:start + batch_size]
+        images = np.stack([bone_model.preprocess_image(Image.open(r["path"])) for r in batch])
+        features = bone_model.extract_features(model, images)
+        norms = np.linalg.norm(features, axis=1, keepdims=True)
+        embeddings[start:start + len(batch)] = features / np.where(norms > 0, norms, 1)
+    embeddings.flush()
+
+    with open(os.path.join(index_dir, REFERENCES_FILE), "w", encoding="utf-8") as f:
+        json.dump({"model_version": model_version, "references": references}, f, ensure_ascii=False)
+    return len(references)
+
+# ===================== QUERY =====================
+def load_index(index_dir=DEFAULT_INDEX_DIR):
+    """Open the index read-only; embeddings stay memory-mapped on disk
+
+    Indexes built before versioning (a bare reference list) load with
+    model_version None and never match a live prediction. Older float16
+    embeddings are upcast once here rather than on every query.
+    """
+    embeddings = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    if embeddings.dtype != np.float32:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+    with open(os.path.join(index_dir, REFERENCES_FILE), encoding="utf-8") as f:
+        meta = json.load(f)
+    if isinstance(meta, list):
+        meta = {"model_version": None, "references": meta}
+    return {
+        "embeddings": embeddings,
+        "references": meta["references"],
+        "model_version": meta["model_version"],
+        "genders": np.array([gender_key(r.get("gender")) for r in meta["references"]]),
+    }
+
+def gender_key(gender):
+    """Normalize any spelling ("Female", "F", "male") to "f" / "m", or "" if unknown"""
+    return (gender or "").strip()[:1].lower()
+
+def query_index(index, features, k=5, gender=None):
+    """Return the k most similar references for one or more embeddings
+
+    Brute-force cosine similarity as one float32 matrix product, followed
+    by argpartition so only the top k rows are ever sorted. With `gender`,
+    references recorded as the other sex are excluded. Fewer than k (or
+    no) matches come back when the index has fewer candidates.
+    """
+    queries = np.atleast_2d(np.asarray(features, dtype=np.float32))
+    queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    scores = queries @ index["embeddings"].T
+
+    candidates = scores.shape[1]
+    if gender_key(gender):
+        excluded = (index["genders"] != gender_key(gender)) & (index["genders"] != "")
+        scores[:, excluded] = -np.inf
+        candidates -= int(excluded.sum())
+    k = min(k, candidates)
+    if k <= 0:
+        return [] if np.ndim(features) == 1 else [[] for _ in queries]
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    results = [
+        [dict(index["references"][i], similarity=float(s)) for i, s in zip(row, row_scores)]
+        for row, row_scores in zip(top, top_scores)
+    ]
+    return results[0] if np.ndim(features) == 1 else results
+
+# ===================== CLI =====================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the reference-atlas embedding index")
+    parser.add_argument("manifest", help="CSV with path,bone_age[,gender] columns")
+    parser.add_argument("--out", default=DEFAULT_INDEX_DIR, help="index output folder")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    count = build_index(args.manifest, args.out, args.batch_size)
+    print(f"Indexed {count} reference images into {args.out}")
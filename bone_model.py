@@ -0,0 +1,193 @@
+import os
+import numpy as np
+from PIL import Image, ImageOps
+
+# ===================== MODEL FILES =====================
+# Model zips are extracted by model_registry.py; this module only loads folders
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Teachable Machine image models expect 224x224 RGB scaled to [-1, 1]
+IMAGE_SIZE = 224
+
+# MobileNetV2 out_relu channels == penultimate embedding size
+FEATURE_DIM = 1280
+
+# ===================== LOADING =====================
+def load_labels(model_dir):
+    """Read class names from labels.txt ("0 0", "1 1", ...)"""
+    with open(os.path.join(model_dir, "labels.txt"), encoding="utf-8") as f:
+        return [line.strip().split(" ", 1)[-1] for line in f if line.strip()]
+
+def load_model(model_dir):
+    """Load an extracted Keras model folder split into backbone and head weights
+
+    The Teachable Machine export is Sequential([backbone, head]) where the
+    backbone is MobileNetV2 + global average pooling and the head is
+    Dense(100, relu) -> Dense(17, softmax, no bias). Only the convolutional
+    part runs in TensorFlow; pooling and the head are applied in numpy so
+    the last conv activations are available without another forward pass.
+    The h5 is read with tf_keras (Keras 2): Keras 3 cannot deserialize the
+    export's DepthwiseConv2D layers.
+
+    `model_dir` is a registry version folder; there is no fallback to the
+    bundled zip, so a missing version fails loudly instead of silently
+    serving a different model.
+    """
+    h5_path = os.path.join(model_dir, "keras_model.h5")
+    if not os.path.exists(h5_path):
+        raise FileNotFoundError(f"{h5_path} not found; register the model with model_registry.py")
+
+    import tf_keras
+
+    keras_model = tf_keras.models.load_model(h5_path, compile=False)
+    backbone, head = keras_model.layers[0], keras_model.layers[1]
+    conv_model = backbone.layers[0]  # functional MobileNetV2, outputs out_relu
+    dense_1, dense_2 = [l for l in head.layers if l.get_weights()]
+    w1, b1 = dense_1.get_weights()
+    w2 = dense_2.get_weights()[0]
+    return {
+        "conv": conv_model,
+        "w1": w1.astype(np.float32),
+        "b1": b1.astype(np.float32),
+        "w2": w2.astype(np.float32),
+        "labels": load_labels(model_dir),
+    }
+
+# ===================== PREPROCESSING =====================
+def resize_image(image):
+    """Center-crop and resize to 224x224 RGB, returned as uint8 (224, 224, 3)"""
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image = ImageOps.fit(image, (IMAGE_SIZE, IMAGE_SIZE), Image.Resampling.LANCZOS)
+    return np.asarray(image, dtype=np.uint8)
+
+def normalize_pixels(pixels):
+    """Scale uint8 pixels (any leading shape) to float32 in [-1, 1]"""
+    return np.asarray(pixels, dtype=np.float32) / 127.5 - 1.0
+
+def preprocess_image(image):
+    """Center-crop and resize to 224x224, scale pixels to [-1, 1]"""
+    return normalize_pixels(resize_image(image))
+
+# ===================== INFERENCE =====================
+def _softmax(logits):
+    """Row-wise softmax"""
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+def head_forward(model, features):
+    """Apply the 17-class head to pooled backbone features (N, 1280)"""
+    hidden_pre = features @ model["w1"] + model["b1"]
+    hidden = np.maximum(hidden_pre, 0)
+    return _softmax(hidden @ model["w2"]), hidden_pre
+
+def class_activation_maps(model, activations, hidden_pre, class_idx):
+    """Grad-CAM heatmaps computed from activations captured in the forward pass
+
+    The head is small enough to differentiate by hand: the gradient of the
+    class logit with respect to the pooled features is
+    W1 @ (W2[:, c] * relu'(hidden_pre)). Global average pooling spreads that
+    gradient evenly over the 7x7 grid, so it doubles as the channel weights.
+    """
+    class_idx = np.asarray(class_idx)
+    channel_weights = ((hidden_pre > 0) * model["w2"][:, class_idx].T) @ model["w1"].T
+    cams = np.maximum(np.einsum("nhwk,nk->nhw", activations, channel_weights), 0)
+    peak = cams.max(axis=(1, 2), keepdims=True)
+    return cams / np.where(peak > 0, peak, 1)
+
+def predict_batch(model, images):
+    """Run one forward pass over preprocessed images (N, 224, 224, 3)
+
+    Returns class probabilities, pooled penultimate features, a
+    class-activation heatmap for the predicted class of each image and the
+    continuous bone-age estimate (N,) with its 90% interval, computed for
+    the whole batch in one estimate_bone_age call.
+    """
+    activations = np.asarray(model["conv"](images, training=False))
+    features = activations.mean(axis=(1, 2))
+    probabilities, hidden_pre = head_forward(model, features)
+    predicted = probabilities.argmax(axis=1)
+    heatmaps = class_activation_maps(model, activations, hidden_pre, predicted)
+    estimate = estimate_bone_age(probabilities, class_ages=label_ages(model["labels"]))
+    return {
+        "probabilities": probabilities,
+        "features": features,
+        "predicted": predicted,
+        "heatmaps": heatmaps,
+        "bone_age": estimate["bone_age"],
+        "bone_age_std": estimate["std"],
+        "bone_age_lower": estimate["lower"],
+        "bone_age_upper": estimate["upper"],
+    }
+
+def extract_features(model, images):
+    """Pooled penultimate-layer embeddings (N, 1280) for preprocessed images"""
+    return np.asarray(model["conv"](images, training=False)).mean(axis=(1, 2))
+
+def predict_image(model, image):
+    """Predict a single PIL image and return a plain-dict result"""
+    result = predict_batch(model, preprocess_image(image)[np.newaxis])
+    idx = int(result["predicted"][0])
+    return {
+        "probabilities": result["probabilities"][0],
+        "features": result["features"][0],
+        "predicted_class": model["labels"][idx],
+        "confidence": float(result["probabilities"][0, idx]),
+        "heatmap": result["heatmaps"][0],
+        "labels": model["labels"],
+        "bone_age": float(result["bone_age"][0]),
+        "bone_age_lower": float(result["bone_age_lower"][0]),
+        "bone_age_upper": float(result["bone_age_upper"][0]),
+    }
+
+# ===================== POST-PROCESSING =====================
+def label_ages(labels):
+    """Bone age in years represented by each class label ("0" ... "16")"""
+    return np.array([float(label) for label in labels], dtype=np.float32)
+
+def estimate_bone_age(probabilities, chronological_age=None, class_ages=None, interval=0.9):
+    """Continuous bone age, uncertainty and advancement from class probabilities
+
+    Works on a single (17,) vector or an (N, 17) matrix in one vectorized
+    pass, so browser results, worklist batches and offline backfills all go
+    through the same code. Returns:
+
+        bone_age       expected value sum(p_k * age_k)
+        std            standard deviation of the class distribution
+        lower, upper   central `interval` range read from the class CDF
+        bone_age_diff  bone_age - chronological_age (None if age not given)
+
+    Values are floats for a single vector and arrays for a matrix.
+    """
+    probs = np.asarray(probabilities, dtype=np.float32)
+    single = probs.ndim == 1
+    probs = np.atleast_2d(probs)
+    probs = probs / np.maximum(probs.sum(axis=1, keepdims=True), 1e-12)
+    ages = np.arange(probs.shape[1], dtype=np.float32) if class_ages is None else np.asarray(class_ages, np.float32)
+
+    expected = probs @ ages
+    std = np.sqrt(np.maximum(probs @ (ages ** 2) - expected ** 2, 0))
+
+    # Class index where the CDF first reaches each tail probability
+    cdf = np.cumsum(probs, axis=1)
+    tail = (1 - interval) / 2
+    lower = ages[np.minimum((cdf < tail).sum(axis=1), len(ages) - 1)]
+    upper = ages[np.minimum((cdf < 1 - tail).sum(axis=1), len(ages) - 1)]
+
+    diff = None if chronological_age is None else expected - np.asarray(chronological_age, np.float32)
+    result = {"bone_age": expected, "std": std, "lower": lower, "upper": upper, "bone_age_diff": diff}
+    if single:
+        result = {k: (None if v is None else float(np.ravel(v)[0])) for k, v in result.items()}
+    return result
+
+# ===================== VISUALIZATION =====================
+def overlay_heatmap(image, heatmap, alpha=0.45, colormap="jet"):
+    """Blend a [0, 1] heatmap over the model's 224x224 view of the X-ray"""
+    import matplotlib
+
+    base = ImageOps.fit(image.convert("RGB"), (IMAGE_SIZE, IMAGE_SIZE), Image.Resampling.LANCZOS)
+    cam = Image.fromarray(np.uint8(heatmap * 255)).resize(base.size, Image.Resampling.BICUBIC)
+    colored = matplotlib.colormaps[colormap](np.asarray(cam) / 255.0)[..., :3]
+    colored = Image.fromarray(np.uint8(colored * 255))
+    return Image.blend(base, colored, alpha)
@@ -0,0 +1,141 @@
+"""Sharded, memory-mapped training set builder for the bone-age model
+
+Expects one folder per bone-age class, named as in labels.txt:
+
+    data/0/*.png, data/1/*.png, ..., data/16/*.png
+
+and writes fixed-size shards of 224x224 uint8 pixels (the same crop and
+resize used at inference; scaling to [-1, 1] happens when batches are
+read) plus an index.json:
+
+    python dataset.py data --out dataset --shard-size 1024 --workers 8
+
+Each worker streams its shard one image at a time into a memory-mapped
+.npy file, so building never holds the whole set in RAM.
+"""
+import argparse
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+
+import bone_model
+import image_quality
+import model_registry
+
+# ===================== FILES =====================
+DEFAULT_DATASET_DIR = os.path.join(bone_model.BASE_DIR, "dataset")
+INDEX_FILE = "index.json"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# ===================== BUILD =====================
+def list_labeled_files(data_dir, labels):
+    """(path, class index) pairs for every image under data_dir/<label>/"""
+    files = []
+    for class_idx, label in enumerate(labels):
+        class_dir = os.path.join(data_dir, label)
+        if not os.path.isdir(class_dir):
+            continue
+        for name in sorted(os.listdir(class_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                files.append((os.path.join(class_dir, name), class_idx))
+    return files
+
+def write_shard(out_dir, shard_id, items, quality_gate):
+    """Write one shard; unreadable or rejected images are skipped
+
+    Arrays are preallocated at len(items) rows, so `count` in the index
+    records how many leading rows are valid.
+    """
+    size = bone_model.IMAGE_SIZE
+    images_name = f"images-{shard_id:05d}.npy"
+    labels_name = f"labels-{shard_id:05d}.npy"
+    images = np.lib.format.open_memmap(
+        os.path.join(out_dir, images_name), mode="w+", dtype=np.uint8, shape=(len(items), size, size, 3)
+    )
+    labels = np.lib.format.open_memmap(
+        os.path.join(out_dir, labels_name), mode="w+", dtype=np.int16, shape=(len(items),)
+    )
+
+    count, files, skipped = 0, [], []
+    for path, class_idx in items:
+        try:
+            with Image.open(path) as image:
+                if quality_gate and image_quality.check_image_quality(image)["status"] == "reject":
+                    skipped.append(path)
+                    continue
+                images[count] = bone_model.resize_image(image)
+        except OSError:
+            skipped.append(path)
+            continue
+        labels[count] = class_idx
+        files.append(path)
+        count += 1
+
+    images.flush()
+    labels.flush()
+    return {"images": images_name, "labels": labels_name, "count": count, "files": files, "skipped": skipped}
+
+def build_dataset(data_dir, out_dir=DEFAULT_DATASET_DIR, shard_size=1024, workers=None,
+                  quality_gate=False, seed=0):
+    """Build all shards in parallel and write index.json
+
+    Files are shuffled with a fixed seed first so every shard mixes classes.
+    """
+    labels = bone_model.load_labels(model_registry.active_model_dir("keras")[1])
+    files = list_labeled_files(data_dir, labels)
+    random.Random(seed).shuffle(files)
+    os.makedirs(out_dir, exist_ok=True)
+
+    chunks = [files[i:i + shard_size] for i in range(0, len(files), shard_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        shards = list(pool.map(
+            write_shard,
+            [out_dir] * len(chunks), range(len(chunks)), chunks, [quality_gate] * len(chunks)
+        ))
+
+    index = {
+        "labels": labels,
+        "image_size": bone_model.IMAGE_SIZE,
+        "shard_size": shard_size,
+        "count": sum(s["count"] for s in shards),
+        "shards": shards,
+    }
+    with open(os.path.join(out_dir, INDEX_FILE), "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    return index
+
+# ===================== READ =====================
+def load_dataset(dataset_dir=DEFAULT_DATASET_DIR):
+    """Open the index; shard arrays are memory-mapped, not loaded"""
+    with open(os.path.join(dataset_dir, INDEX_FILE), encoding="utf-8") as f:
+        index = json.load(f)
+    index["arrays"] = [
+        (np.load(os.path.join(dataset_dir, s["images"]), mmap_mode="r")[:s["count"]],
+         np.load(os.path.join(dataset_dir, s["labels"]), mmap_mode="r")[:s["count"]])
+        for s in index["shards"]
+    ]
+    return index
+
+def iter_batches(dataset, batch_size=64):
+    """Yield (normalized images, labels) batches shard by shard"""
+    for images, labels in dataset["arrays"]:
+        for start in range(0, len(images), batch_size):
+            yield (bone_model.normalize_pixels(images[start:start + batch_size]),
+                   np.asarray(labels[start:start + batch_size]))
+
+# ===================== CLI =====================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build memory-mapped training shards")
+    parser.add_argument("data_dir", help="folder with one sub-folder per class in labels.txt")
+    parser.add_argument("--out", default=DEFAULT_DATASET_DIR, help="dataset output folder")
+    parser.add_argument("--shard-size", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=None, help="default: all cores")
+    parser.add_argument("--quality-gate", action="store_true", help="skip images the quality gate rejects")
+    args = parser.parse_args()
+
+    index = build_dataset(args.data_dir, args.out, args.shard_size, args.workers, args.quality_gate)
+    skipped = sum(len(s["skipped"]) for s in index["shards"])
+    print(f"Wrote {index['count']} images in {len(index['shards'])} shards to {args.out} ({skipped} skipped)")
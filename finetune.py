@@ -0,0 +1,175 @@
+"""CPU head-only fine-tuning of the active bone-age model
+
+The MobileNetV2 backbone stays frozen. It runs over the training shards
+(built by dataset.py) exactly once and its pooled penultimate features
+are cached next to the dataset. Every epoch after that only touches the
+small Dense(100) -> Dense(17) head on 1280-d vectors:
+
+    python finetune.py dataset --out converted_keras_finetuned.zip
+
+The output zip has the same layout as converted_keras.zip.
+"""
+import argparse
+import json
+import os
+import tempfile
+import zipfile
+import numpy as np
+
+import bone_model
+import dataset
+import model_registry
+
+# ===================== FEATURE CACHE =====================
+FEATURES_DIR = "features"
+CACHE_META = "meta.json"
+
+def cache_features(dataset_dir, model, model_version, batch_size=64, refresh=False):
+    """Run the frozen backbone once and memory-map (features, labels) on disk
+
+    The cache is keyed on the sha256 of the dataset's index.json and on
+    the registry version of the model, so rebuilding the dataset (even
+    with the same image count) or activating another backbone
+    invalidates it. Files are written under temporary names and renamed only once
+    complete; meta.json is written last, so an interrupted run is never
+    mistaken for a valid cache.
+    """
+    cache_dir = os.path.join(dataset_dir, FEATURES_DIR)
+    features_path = os.path.join(cache_dir, "features.npy")
+    labels_path = os.path.join(cache_dir, "labels.npy")
+    meta_path = os.path.join(cache_dir, CACHE_META)
+    data = dataset.load_dataset(dataset_dir)
+    index_sha = model_registry.file_sha256(os.path.join(dataset_dir, dataset.INDEX_FILE))
+
+    if not refresh and os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("index_sha256") == index_sha and meta.get("model_version") == model_version:
+            return np.load(features_path, mmap_mode="r"), np.load(labels_path)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    features = np.lib.format.open_memmap(
+        features_path + ".partial", mode="w+", dtype=np.float32, shape=(data["count"], bone_model.FEATURE_DIM)
+    )
+    labels = np.empty(data["count"], dtype=np.int16)
+    row = 0
+    for images, batch_labels in dataset.iter_batches(data, batch_size):
+        features[row:row + len(images)] = bone_model.extract_features(model, images)
+        labels[row:row + len(images)] = batch_labels
+        row += len(images)
+    features.flush()
+    del features
+    os.replace(features_path + ".partial", features_path)
+    with open(labels_path + ".partial", "wb") as f:
+        np.save(f, labels)
+    os.replace(labels_path + ".partial", labels_path)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"index_sha256": index_sha, "model_version": model_version, "count": data["count"]}, f)
+    return np.load(features_path, mmap_mode="r"), labels
+
+# ===================== HEAD TRAINING =====================
+def split_holdout(labels, val_fraction=0.2, seed=0):
+    """Per-class random split so every class appears in the held-out set"""
+    rng = np.random.default_rng(seed)
+    val = np.zeros(len(labels), dtype=bool)
+    for cls in np.unique(labels):
+        members = rng.permutation(np.flatnonzero(labels == cls))
+        val[members[:int(round(len(members) * val_fraction))]] = True
+    return np.flatnonzero(~val), np.flatnonzero(val)
+
+def train_head(model, features, labels, epochs=200, learning_rate=1e-3, val_fraction=0.1,
+               test_fraction=0.2, seed=0):
+    """Retrain the 17-class head on cached features, starting from current weights
+
+    A test split is held out first and never seen during training; early
+    stopping monitors a separate validation split carved from the rest,
+    so the reported accuracy is not biased by the stopping epoch.
+    """
+    import tf_keras as keras
+
+    keras.utils.set_random_seed(seed)
+    rest_idx, test_idx = split_holdout(labels, test_fraction, seed)
+    inner_train, inner_val = split_holdout(labels[rest_idx], val_fraction / (1 - test_fraction), seed + 1)
+    train_idx, val_idx = rest_idx[inner_train], rest_idx[inner_val]
+    features = np.asarray(features)
+
+    head = keras.Sequential([
+        keras.layers.Input(shape=(bone_model.FEATURE_DIM,)),
+        keras.layers.Dense(100, activation="relu"),
+        keras.layers.Dense(len(model["labels"]), activation="softmax", use_bias=False),
+    ])
+    head.layers[0].set_weights([model["w1"], model["b1"]])
+    head.layers[1].set_weights([model["w2"]])
+    head.compile(
+        optimizer=keras.optimizers.Adam(learning_rate),
+        loss="sparse_categorical_crossentropy",
+        metrics=["accuracy"],
+    )
+    head.fit(
+        features[train_idx], labels[train_idx],
+        validation_data=(features[val_idx], labels[val_idx]),
+        epochs=epochs, batch_size=256, verbose=2,
+        callbacks=[keras.callbacks.EarlyStopping(monitor="val_loss", patience=15, restore_best_weights=True)],
+    )
+
+    w1, b1 = head.layers[0].get_weights()
+    w2 = head.layers[1].get_weights()[0]
+    tuned = dict(model, w1=w1, b1=b1, w2=w2)
+    return tuned, evaluate_head(model, tuned, features[test_idx], labels[test_idx])
+
+def evaluate_head(base_model, tuned_model, features, labels):
+    """Held-out accuracy (exact and within one year) before and after tuning"""
+    report = {"test_count": int(len(labels))}
+    for name, m in (("base", base_model), ("tuned", tuned_model)):
+        predicted = bone_model.head_forward(m, features)[0].argmax(axis=1)
+        report[f"{name}_accuracy"] = float(np.mean(predicted == labels))
+        report[f"{name}_within_1"] = float(np.mean(np.abs(predicted - labels) <= 1))
+    return report
+
+# ===================== EXPORT =====================
+def export_model(tuned, out_zip, model_dir):
+    """Write a converted_keras-style zip with the retrained head weights
+
+    `model_dir` is the registry folder of the model that was tuned, so the
+    backbone in the export is exactly the one the features came from.
+    """
+    import tf_keras
+
+    keras_model = tf_keras.models.load_model(os.path.join(model_dir, "keras_model.h5"), compile=False)
+    dense_1, dense_2 = [l for l in keras_model.layers[1].layers if l.get_weights()]
+    dense_1.set_weights([tuned["w1"], tuned["b1"]])
+    dense_2.set_weights([tuned["w2"]])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        h5_path = os.path.join(tmp, "keras_model.h5")
+        keras_model.save(h5_path)
+        with zipfile.ZipFile(out_zip, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.write(h5_path, "keras_model.h5")
+            zf.write(os.path.join(model_dir, "labels.txt"), "labels.txt")
+    return out_zip
+
+# ===================== CLI =====================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fine-tune only the classifier head on cached features")
+    parser.add_argument("dataset_dir", help="output folder of dataset.py")
+    parser.add_argument("--out", default=os.path.join(bone_model.BASE_DIR, "converted_keras_finetuned.zip"))
+    parser.add_argument("--epochs", type=int, default=200)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--val-fraction", type=float, default=0.1, help="early-stopping split")
+    parser.add_argument("--test-fraction", type=float, default=0.2, help="held-out split for the report")
+    parser.add_argument("--refresh-features", action="store_true", help="re-run the backbone even if cached")
+    args = parser.parse_args()
+
+    base_version, base_dir = model_registry.active_model_dir("keras")
+    model = bone_model.load_model(base_dir)
+    features, labels = cache_features(args.dataset_dir, model, base_version, refresh=args.refresh_features)
+    tuned, report = train_head(model, features, labels, args.epochs, args.lr, args.val_fraction, args.test_fraction)
+    export_model(tuned, args.out, base_dir)
+
+    print(f"Base model version {base_version}")
+    print(f"Held-out test images: {report['test_count']}")
+    print(f"Accuracy        base {report['base_accuracy'] * 100:.1f}%  ->  tuned {report['tuned_accuracy'] * 100:.1f}%")
+    print(f"Within ±1 class base {report['base_within_1'] * 100:.1f}%  ->  tuned {report['tuned_within_1'] * 100:.1f}%")
+    print(f"Saved fine-tuned model to {args.out}")
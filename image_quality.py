@@ -0,0 +1,140 @@
+"""Cheap pre-inference quality gate for hand radiographs
+
+Every check is a handful of vectorized numpy operations on a downsampled
+grayscale copy, so an unusable upload is rejected in a few milliseconds
+instead of costing a model forward pass.
+"""
+import numpy as np
+from PIL import Image
+
+# ===================== THRESHOLDS =====================
+MIN_SIDE = 224              # px, the model input size
+ANALYSIS_SIDE = 512         # px, longest side used for the checks below
+MIN_LAPLACIAN_VAR = 30.0    # below this the film is too blurred
+BLUR_FLAG_VAR = 80.0
+DARK_MEAN, BRIGHT_MEAN = 25, 230
+MAX_CLIPPED = 0.35          # fraction of hand (foreground) pixels at 0 or 255
+CLIPPED_FLAG = 0.15
+MIN_FOREGROUND, MAX_FOREGROUND = 0.08, 0.75
+MIN_FINGER_RUNS = 3         # separate foreground runs across the finger rows
+
+# ===================== HELPERS =====================
+def to_gray_array(image, max_side=ANALYSIS_SIDE):
+    """Downsample to at most max_side and return a float32 grayscale array"""
+    gray = image.convert("L")
+    scale = max_side / max(gray.size)
+    if scale < 1:
+        gray = gray.resize((max(1, round(gray.width * scale)), max(1, round(gray.height * scale))),
+                           Image.Resampling.BILINEAR)
+    return np.asarray(gray, dtype=np.float32)
+
+def laplacian_variance(gray):
+    """Variance of the 4-neighbour Laplacian (low = blurred)"""
+    lap = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+           - 4 * gray[1:-1, 1:-1])
+    return float(lap.var())
+
+def otsu_threshold(gray):
+    """Otsu threshold computed from the 256-bin histogram"""
+    hist = np.bincount(gray.astype(np.uint8).ravel(), minlength=256).astype(np.float64)
+    weight_bg = np.cumsum(hist)
+    weight_fg = weight_bg[-1] - weight_bg
+    cum_mean = np.cumsum(hist * np.arange(256))
+    mean_bg = cum_mean / np.maximum(weight_bg, 1)
+    mean_fg = (cum_mean[-1] - cum_mean) / np.maximum(weight_fg, 1)
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between))
+
+def border_mean(gray):
+    """Mean intensity of the outermost rows and columns of the frame"""
+    edges = np.concatenate([gray[0], gray[-1], gray[1:-1, 0], gray[1:-1, -1]])
+    return float(edges.mean())
+
+def foreground_mask(gray):
+    """Otsu foreground, inverted when the film's background is bright
+
+    Polarity comes from the frame edge, which is background on any hand
+    film, rather than from the foreground share, so a tightly cropped hand
+    filling most of the frame is not inverted.
+    """
+    threshold = otsu_threshold(gray)
+    mask = gray > threshold
+    if border_mean(gray) > threshold:
+        mask = ~mask
+    return mask
+
+def max_finger_runs(mask):
+    """Most separate foreground runs on any row in the top third of the object
+
+    A hand has spread fingers, so scan lines through the distal part of
+    the foreground cross several separate bright runs; a forearm, skull
+    or chest scout does not.
+    """
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return 0
+    top = rows[0]
+    band = mask[top:top + max(1, (rows[-1] - top) // 3)].astype(np.int8)
+    rising = np.diff(band, axis=1, prepend=0) == 1
+    return int(rising.sum(axis=1).max())
+
+# ===================== QUALITY GATE =====================
+def check_image_quality(image):
+    """Score an X-ray before inference
+
+    Returns {"status": "ok" | "flag" | "reject", "issues": [...], "metrics": {...}}.
+    Rejected images should not be sent to the model; flagged images may be
+    analyzed but the result deserves a second look.
+    """
+    issues = []
+    rejected = False
+
+    width, height = image.size
+    if min(width, height) < MIN_SIDE:
+        issues.append(f"Resolution too low ({width}x{height}, need ≥ {MIN_SIDE} px)")
+        rejected = True
+
+    gray = to_gray_array(image)
+    sharpness = laplacian_variance(gray)
+    mean = float(gray.mean())
+    mask = foreground_mask(gray)
+    # Black collimation around the hand is expected; only saturation on the hand matters
+    clipped = float(np.mean((gray[mask] <= 1) | (gray[mask] >= 254))) if mask.any() else 0.0
+    foreground = float(mask.mean())
+    finger_runs = max_finger_runs(mask)
+
+    if sharpness < MIN_LAPLACIAN_VAR:
+        issues.append(f"Image is blurred (Laplacian variance {sharpness:.0f})")
+        rejected = True
+    elif sharpness < BLUR_FLAG_VAR:
+        issues.append(f"Image may be slightly blurred (Laplacian variance {sharpness:.0f})")
+
+    if mean < DARK_MEAN or mean > BRIGHT_MEAN:
+        issues.append(f"Exposure out of range (mean intensity {mean:.0f})")
+        rejected = True
+    if clipped > MAX_CLIPPED:
+        issues.append(f"Histogram saturated ({clipped * 100:.0f}% of hand pixels clipped)")
+        rejected = True
+    elif clipped > CLIPPED_FLAG:
+        issues.append(f"Partially saturated ({clipped * 100:.0f}% of hand pixels clipped)")
+
+    if not MIN_FOREGROUND <= foreground <= MAX_FOREGROUND:
+        issues.append(f"No hand-sized foreground found ({foreground * 100:.0f}% of frame)")
+        rejected = True
+    elif finger_runs < MIN_FINGER_RUNS:
+        issues.append("Foreground does not look like a hand (no separate fingers detected)")
+
+    status = "reject" if rejected else ("flag" if issues else "ok")
+    return {
+        "status": status,
+        "issues": issues,
+        "metrics": {
+            "width": width,
+            "height": height,
+            "laplacian_var": sharpness,
+            "mean_intensity": mean,
+            "clipped_fraction": clipped,
+            "foreground_fraction": foreground,
+            "finger_runs": finger_runs,
+        },
+    }
@@ -0,0 +1,207 @@
+"""Local load generator for main.py
+
+Drives the app headlessly with streamlit.testing.v1.AppTest, one simulated
+clinician per process. AppTest installs and tears down the process-global
+Streamlit Runtime on every run, so several AppTests cannot share a process;
+separate processes keep each session's reruns independent while they all
+compete for the same CPU cores. Every session runs the same scenario per
+iteration:
+
+    upload X-ray -> toggle secondary signs -> generate clinical report
+
+AppTest cannot drive st.file_uploader, so the upload step runs the same
+server-side work an upload triggers (quality gate + CPU model forward pass)
+directly. It is timed as its own step and reported per step only; the
+headline percentiles and throughput cover real script reruns, and are
+withheld for any level where a session failed.
+
+    python loadtest.py --xray sample.jpg --levels 1,2,4,8 --iterations 5
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import resource
+import threading
+import time
+import numpy as np
+from PIL import Image
+
+from streamlit.testing.v1 import AppTest
+
+import bone_model
+import image_quality
+import model_registry
+
+APP_PATH = os.path.join(bone_model.BASE_DIR, "main.py")
+SIGN_LABELS = ["📍 Pubarche", "📍 Axillary Hair", "📍 Apocrine Body Odor"]
+REPORT_BUTTON = "🔍 Generate Clinical Report"
+RERUN_STEPS = ("initial", "toggle", "report")  # "upload" calls the model directly
+RUN_TIMEOUT = 120      # s, per AppTest run
+START_TIMEOUT = 300    # s, for every session to import the app and load the model
+
+# ===================== MEMORY =====================
+def rss_mb(pid):
+    """Resident set size of one process in MB (0 if it is gone or /proc is missing)"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return 0.0
+
+def children_peak_rss_mb():
+    """Largest finished child's peak RSS, for platforms without /proc"""
+    # macOS reports ru_maxrss in bytes, Linux in KB
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak / 2**20 if os.uname().sysname == "Darwin" else peak / 2**10
+
+class MemorySampler(threading.Thread):
+    """Background thread recording the peak combined RSS of the session processes"""
+
+    def __init__(self, pids, interval=0.05):
+        super().__init__(daemon=True)
+        self.pids = pids
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, sum(rss_mb(pid) for pid in self.pids))
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+# ===================== SESSION SCENARIO =====================
+def find_widget(widgets, label_prefix):
+    """First widget whose label starts with label_prefix"""
+    return next(w for w in widgets if w.label.startswith(label_prefix))
+
+def timed_rerun(step, rerun, samples):
+    """Time one AppTest rerun and fail the session on any script exception"""
+    start = time.perf_counter()
+    at = rerun()
+    samples.append((step, time.perf_counter() - start))
+    if at.exception:
+        raise RuntimeError(f"{step}: {at.exception[0].message}")
+    return at
+
+def simulate_session(xray_path, iterations, use_model, ready, results):
+    """One clinician, in its own process: repeated upload / toggle / report cycles
+
+    Imports and model loading happen before `ready`, so every session
+    starts its scenario at the same moment. Puts (samples, error) on
+    `results`.
+    """
+    samples, error, started = [], None, False
+    try:
+        model = model_registry.load_active()[1] if use_model else None
+        at = AppTest.from_file(APP_PATH, default_timeout=RUN_TIMEOUT)
+        ready.wait(START_TIMEOUT)
+        started = True
+        timed_rerun("initial", at.run, samples)
+
+        for i in range(iterations):
+            start = time.perf_counter()
+            image = Image.open(xray_path)
+            image_quality.check_image_quality(image)
+            if model is not None:
+                bone_model.predict_image(model, image)
+            samples.append(("upload", time.perf_counter() - start))
+
+            for label in SIGN_LABELS:
+                timed_rerun("toggle", find_widget(at.checkbox, label).set_value(i % 2 == 0).run, samples)
+            timed_rerun("report", find_widget(at.button, REPORT_BUTTON).click().run, samples)
+    except Exception as exc:
+        error = repr(exc)
+        if not started:
+            ready.abort()  # release the other sessions instead of letting them wait out the timeout
+    results.put((samples, error))
+
+# ===================== LEVELS =====================
+def run_level(sessions, xray_path, iterations, use_model):
+    """Run `sessions` concurrent clinicians and summarize their reruns"""
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Barrier(sessions + 1)
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=simulate_session, args=(xray_path, iterations, use_model, ready, results))
+        for _ in range(sessions)
+    ]
+    for p in processes:
+        p.start()
+    sampler = MemorySampler([p.pid for p in processes])
+    sampler.start()
+    try:
+        ready.wait(START_TIMEOUT)
+    except threading.BrokenBarrierError:
+        pass
+    wall_start = time.perf_counter()
+
+    timings, errors = [], []
+    session_timeout = RUN_TIMEOUT * (1 + (len(SIGN_LABELS) + 1) * iterations)
+    for _ in processes:
+        try:
+            samples, error = results.get(timeout=session_timeout)
+        except queue.Empty:
+            samples, error = [], "session produced no result (crashed or hung)"
+        timings.extend(samples)
+        if error:
+            errors.append(error)
+    wall = time.perf_counter() - wall_start
+    sampler.stop()
+    for p in processes:
+        p.join(timeout=10)
+        if p.is_alive():
+            p.terminate()
+
+    latencies = np.array([t for step, t in timings if step in RERUN_STEPS]) * 1000
+    # A failed session stops generating load, so the survivors' numbers would be misleading
+    valid = not errors and latencies.size > 0
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if valid else (np.nan,) * 3
+    by_step = {}
+    for step, t in timings:
+        by_step.setdefault(step, []).append(t * 1000)
+    return {
+        "sessions": sessions,
+        "valid": valid,
+        "reruns": int(latencies.size),
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "throughput": latencies.size / wall if valid else np.nan,
+        "peak_rss_mb": sampler.peak_mb or children_peak_rss_mb(),
+        "step_p95_ms": {step: float(np.percentile(v, 95)) for step, v in by_step.items()},
+        "errors": errors,
+    }
+
+def print_report(results):
+    """Print one row per concurrency level"""
+    print(f"{'sessions':>8} {'reruns':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'reruns/s':>9} {'peak RSS MB':>12} {'errors':>7}")
+    for r in results:
+        if r["valid"]:
+            stats = (f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} "
+                     f"{r['throughput']:>9.2f}")
+        else:
+            stats = f"{'invalid':>9} {'-':>9} {'-':>9} {'-':>9}"
+        print(f"{r['sessions']:>8} {r['reruns']:>7} {stats} {r['peak_rss_mb']:>12.1f} {len(r['errors']):>7}")
+    for r in results:
+        steps = ", ".join(f"{step}{'' if step in RERUN_STEPS else ' (direct)'} {ms:.0f}"
+                          for step, ms in sorted(r["step_p95_ms"].items()))
+        print(f"  {r['sessions']} sessions, p95 by step (ms): {steps}")
+        for error in r["errors"][:3]:
+            print(f"  ! {error}")
+
+# ===================== CLI =====================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate concurrent clinicians against main.py")
+    parser.add_argument("--xray", required=True, help="hand X-ray used for every simulated upload")
+    parser.add_argument("--levels", default="1,2,4,8", help="comma-separated session counts")
+    parser.add_argument("--iterations", type=int, default=3, help="scenario repeats per session")
+    parser.add_argument("--no-model", action="store_true", help="skip the CPU model in the upload step")
+    args = parser.parse_args()
+
+    results = [run_level(int(n), args.xray, args.iterations, not args.no_model) for n in args.levels.split(",")]
+    print_report(results)
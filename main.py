@@ -6,7 +6,18 @@ from datetime import datetime, date
 from dateutil.relativedelta import relativedelta
 from PIL import Image
 import base64
+import hashlib
+import os
 from io import BytesIO
+import bone_model
+import atlas
+import image_quality
+import model_registry
+import session_memory
+import analytics_log
+import worklist
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # ===================== PAGE CONFIG =====================
 st.set_page_config(
@@ -229,174 +240,216 @@ def assess_risk_level(age, gender, secondary_signs, bone_age_diff):
     else:
         return "low"
 
-def create_tm_html(image_data):
-    """Create HTML with Teachable Machine model integration"""
-    html_code = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <script src="https://cdn.jsdelivr.net/npm/@tensorflow/tfjs@latest/dist/tf.min.js"></script>
-        <script src="https://cdn.jsdelivr.net/npm/@teachablemachine/image@latest/dist/teachablemachine-image.min.js"></script>
-        <style>
-            body {{
-                font-family: 'Arial', sans-serif;
-                padding: 20px;
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            }}
-            .container {{
-                background: white;
-                padding: 25px;
-                border-radius: 15px;
-                box-shadow: 0 8px 32px rgba(0,0,0,0.1);
-            }}
-            .status {{
-                padding: 12px;
-                border-radius: 8px;
-                margin: 10px 0;
-                font-weight: bold;
-            }}
-            .success {{ background-color: #d1fae5; color: #065f46; }}
-            .error {{ background-color: #fee2e2; color: #991b1b; }}
-            .loading {{ background-color: #dbeafe; color: #1e40af; }}
-            .prediction-item {{
-                margin: 12px 0;
-                background: #f9fafb;
-                padding: 15px;
-                border-radius: 10px;
-                border-left: 4px solid #667eea;
-            }}
-            .progress-bar {{
-                background: #e5e7eb;
-                height: 24px;
-                border-radius: 12px;
-                margin-top: 8px;
-                overflow: hidden;
-            }}
-            .progress-fill {{
-                height: 100%;
-                background: linear-gradient(90deg, #667eea, #764ba2);
-                border-radius: 12px;
-                transition: width 0.3s ease;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                color: white;
-                font-weight: bold;
-                font-size: 12px;
-            }}
-            .final-result {{
-                margin-top: 20px;
-                padding: 20px;
-                background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
-                color: white;
-                border-radius: 12px;
-                text-align: center;
-            }}
-            h2 {{ color: #1e40af; margin-top: 0; }}
-            h3 {{ color: #4f46e5; margin: 5px 0; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h2>🤖 AI X-ray Image Analysis</h2>
-            <div id="status" class="status loading">⏳ Loading AI Model...</div>
-            <div id="result"></div>
-        </div>
-        
-        <script type="text/javascript">
-            const URL = "https://teachablemachine.withgoogle.com/models/AffepRuZp/";
-            let model, maxPredictions;
-
-            async function init() {{
-                const modelURL = URL + "model.json";
-                const metadataURL = URL + "metadata.json";
-
-                try {{
-                    model = await tmImage.load(modelURL, metadataURL);
-                    maxPredictions = model.getTotalClasses();
-                    
-                    document.getElementById("status").className = "status success";
-                    document.getElementById("status").innerHTML = '✅ AI Model Loaded Successfully! Analyzing Image...';
-                    
-                    await predict();
-                }} catch (error) {{
-                    document.getElementById("status").className = "status error";
-                    document.getElementById("status").innerHTML = '❌ Model Loading Error: ' + error.message;
-                }}
-            }}
-
-            async function predict() {{
-                try {{
-                    const img = new Image();
-                    img.src = "{image_data}";
-                    
-                    await img.decode();
-                    
-                    const prediction = await model.predict(img);
-                    
-                    let resultHTML = '<h2>🎯 AI Analysis Results:</h2>';
-                    let maxProb = 0;
-                    let maxClass = '';
-                    
-                    for (let i = 0; i < maxPredictions; i++) {{
-                        const className = prediction[i].className;
-                        const probability = (prediction[i].probability * 100).toFixed(1);
-                        
-                        if (prediction[i].probability > maxProb) {{
-                            maxProb = prediction[i].probability;
-                            maxClass = className;
-                        }}
-                        
-                        resultHTML += '<div class="prediction-item">';
-                        resultHTML += '<div style="display: flex; justify-content: space-between; align-items: center;">';
-                        resultHTML += '<strong style="font-size: 16px;">📊 ' + className + '</strong>';
-                        resultHTML += '<span style="font-size: 18px; font-weight: bold; color: #667eea;">' + probability + '%</span>';
-                        resultHTML += '</div>';
-                        resultHTML += '<div class="progress-bar">';
-                        resultHTML += '<div class="progress-fill" style="width: ' + probability + '%;">';
-                        if (parseFloat(probability) > 20) {{
-                            resultHTML += probability + '%';
-                        }}
-                        resultHTML += '</div></div></div>';
-                    }}
-                    
-                    resultHTML += '<div class="final-result">';
-                    resultHTML += '<h3>🏆 Predicted Classification</h3>';
-                    resultHTML += '<h2 style="margin: 10px 0; color: white;">' + maxClass + '</h2>';
-                    resultHTML += '<p style="font-size: 18px; margin: 5px 0;">Confidence Level: ' + (maxProb * 100).toFixed(1) + '%</p>';
-                    resultHTML += '</div>';
-                    
-                    document.getElementById("result").innerHTML = resultHTML;
-                    document.getElementById("status").className = "status success";
-                    document.getElementById("status").innerHTML = '✅ Analysis Complete!';
-                    
-                    window.parent.postMessage({{
-                        type: 'prediction',
-                        data: {{
-                            predictions: prediction,
-                            maxClass: maxClass,
-                            maxProb: maxProb
-                        }}
-                    }}, '*');
-                    
-                }} catch (error) {{
-                    document.getElementById("status").className = "status error";
-                    document.getElementById("status").innerHTML = '❌ Analysis Error: ' + error.message;
-                }}
-            }}
-
-            window.onload = init;
-        </script>
-    </body>
-    </html>
+def estimate_ai_bone_age(ai_prediction, worklist_case, age):
+    """Bone age, interval and advancement from whichever AI result is available
+
+    Server and worklist predictions carry the estimate computed in their
+    forward pass; only browser-fallback results are estimated here.
     """
-    return html_code
+    prediction = ai_prediction or (worklist_case["prediction"] if worklist_case else None)
+    if not prediction:
+        return None
+    if "bone_age" in prediction:
+        return {
+            "bone_age": prediction["bone_age"],
+            "lower": prediction["bone_age_lower"],
+            "upper": prediction["bone_age_upper"],
+            "bone_age_diff": prediction["bone_age"] - age,
+        }
+    probabilities = [item["probability"] for item in prediction["predictions"]]
+    labels = [item["className"] for item in prediction["predictions"]]
+    return bone_model.estimate_bone_age(probabilities, age, bone_model.label_ages(labels))
+
+def encode_image_data(image):
+    """Encode a PIL image as a base64 JPEG data URL for the browser model"""
+    buffered = BytesIO()
+    image.save(buffered, format="JPEG")
+    img_str = base64.b64encode(buffered.getvalue()).decode()
+    return f"data:image/jpeg;base64,{img_str}"
+
+# ===================== TEACHABLE MACHINE COMPONENT =====================
+# Bidirectional component, used only when the server model cannot load: runs
+# the browser model once and returns
+# {"predictions": [...], "maxClass": str, "maxProb": float} to Python.
+# The tfjs model is served from tm_component/models/<version>/ by the registry.
+tm_bone_age = components.declare_component(
+    "tm_bone_age",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "tm_component")
+)
+
+# ===================== SERVER-SIDE MODEL =====================
+# Missing TensorFlow or tf_keras, unreadable files, or a Keras that cannot
+# deserialize the Teachable Machine h5
+MODEL_LOAD_ERRORS = (ImportError, OSError, ValueError, TypeError)
+
+@st.cache_resource(show_spinner=False)
+def get_model_registry():
+    """One registry per server process; it hot-swaps models when registry.json changes"""
+    return model_registry.ModelRegistry()
+
+@st.cache_resource(show_spinner=False)
+def get_analytics_log():
+    """Background Parquet writer shared by all sessions"""
+    return analytics_log.AnalyticsLog()
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def analyze_xray(image_bytes, model_version, _model):
+    """Predict an uploaded X-ray; the heatmap is cached with the prediction
+
+    Keyed on the model version, so a hot-swapped model never serves
+    results cached from the previous one. Only cache misses are real
+    analyses, so that is where they are logged.
+    """
+    image = Image.open(BytesIO(image_bytes))
+    result = dict(bone_model.predict_image(_model, image), model_version=model_version)
+    get_analytics_log().log(
+        "analysis", source="server", input_hash=hashlib.sha256(image_bytes).hexdigest(),
+        model_version=model_version, probabilities=result["probabilities"]
+    )
+    return result
+
+# Per-session prediction records kept for re-display; the oldest are dropped first
+AI_PREDICTION_LIMIT = 32
+
+def remember_prediction(xray_hash, record):
+    """Store a prediction record for this session, bounded to AI_PREDICTION_LIMIT"""
+    predictions = st.session_state.ai_predictions
+    predictions.pop(xray_hash, None)
+    predictions[xray_hash] = record
+    while len(predictions) > AI_PREDICTION_LIMIT:
+        predictions.pop(next(iter(predictions)))
+
+def server_prediction_record(result):
+    """Store a server-side result in the browser component's format, plus its heatmap"""
+    probabilities = [float(p) for p in result["probabilities"]]
+    return {
+        "predictions": [{"className": c, "probability": p} for c, p in zip(result["labels"], probabilities)],
+        "maxClass": result["predicted_class"],
+        "maxProb": result["confidence"],
+        "model_version": result["model_version"],
+        "source": "server",
+        "heatmap": result["heatmap"],
+        "features": result["features"],
+        "bone_age": result["bone_age"],
+        "bone_age_lower": result["bone_age_lower"],
+        "bone_age_upper": result["bone_age_upper"],
+    }
+
+# ===================== SESSION MEMORY =====================
+def session_is_active(session_id):
+    """True while the browser tab for this session is still connected"""
+    return runtime.exists() and runtime.get_instance().is_active_session(session_id)
+
+@st.cache_resource(show_spinner=False)
+def get_session_memory():
+    """Process-wide, budgeted store for per-session images and data URLs"""
+    return session_memory.SessionMemory(is_active=session_is_active)
+
+def decode_xray(image_bytes):
+    """Decode an upload to an RGB PIL image"""
+    image = Image.open(BytesIO(image_bytes))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def check_xray_quality(image_bytes):
+    """Quality gate run before any model sees the upload"""
+    return image_quality.check_image_quality(Image.open(BytesIO(image_bytes)))
+
+@st.cache_resource(show_spinner=False)
+def get_atlas_index():
+    """Open the memory-mapped reference atlas, or None if it was never built"""
+    if not os.path.exists(os.path.join(atlas.DEFAULT_INDEX_DIR, atlas.EMBEDDINGS_FILE)):
+        return None
+    return atlas.load_index()
 
 # ===================== INITIALIZE SESSION STATE =====================
 if 'calculated_age' not in st.session_state:
     st.session_state.calculated_age = None
 if 'age_text' not in st.session_state:
     st.session_state.age_text = None
+if 'ai_predictions' not in st.session_state:
+    st.session_state.ai_predictions = {}  # X-ray sha256 -> prediction record, oldest first
+if 'pending_analysis' not in st.session_state:
+    st.session_state.pending_analysis = None
+if 'server_model_error' not in st.session_state:
+    st.session_state.server_model_error = None  # why the pending analysis fell back to the browser
+if 'worklist' not in st.session_state:
+    st.session_state.worklist = None
+
+# Creating the registry starts warming the server model in the background, so
+# the first Analyze click after a restart does not pay the cold load
+get_model_registry()
+
+# ===================== WORKLIST =====================
+def sync_worklist_decision():
+    """Load the current case's decision into the manual bone age entry"""
+    decision = st.session_state.worklist.decision() if st.session_state.worklist else None
+    st.session_state.bone_age_known = decision is not None
+    if decision:
+        st.session_state.manual_bone_age = decision["bone_age"]
+    else:
+        st.session_state.pop("manual_bone_age", None)
+
+def start_worklist():
+    """Queue studies from the server folder, or else from the uploaded files"""
+    folder = st.session_state.worklist_folder.strip()
+    if folder and os.path.isdir(folder):
+        studies = worklist.folder_studies(folder)
+    else:
+        studies = worklist.upload_studies(st.session_state.worklist_upload or [])
+    if studies:
+        end_worklist()
+        st.session_state.worklist = worklist.Worklist(
+            studies, get_model_registry(), get_session_memory(), get_script_run_ctx().session_id,
+            log=get_analytics_log().log
+        )
+        sync_worklist_decision()
+
+def end_worklist():
+    """Stop prefetching and return to single-patient mode"""
+    if st.session_state.worklist:
+        st.session_state.worklist.close()
+        st.session_state.worklist = None
+        sync_worklist_decision()
+
+def step_worklist(delta):
+    """Move to the previous/next case"""
+    active = st.session_state.worklist
+    active.go_to(active.index + delta)
+    sync_worklist_decision()
+
+def force_worklist_analysis():
+    """Clinician override: analyze the current case despite its quality reject"""
+    st.session_state.worklist.force_analysis()
+
+def decide_worklist(bone_age, source):
+    """Confirm the AI bone age or save an override for the current case"""
+    st.session_state.worklist.decide(bone_age, source)
+    sync_worklist_decision()
+
+def override_worklist():
+    """Save the override typed for the current case"""
+    active = st.session_state.worklist
+    decide_worklist(st.session_state[f"worklist_override_{active.index}"], "override")
+
+# The SessionMemory sweep closes the worklist once its tab has disconnected
+if st.session_state.worklist is not None and st.session_state.worklist.closed:
+    st.session_state.worklist = None
+    sync_worklist_decision()
+
+with st.sidebar:
+    st.markdown("### 📋 Radiologist Worklist")
+    st.text_input("Study folder (on server)", key="worklist_folder")
+    st.file_uploader("...or queue X-ray files", type=["jpg", "png", "jpeg"],
+                     accept_multiple_files=True, key="worklist_upload")
+    col_start, col_end = st.columns(2)
+    with col_start:
+        st.button("▶️ Start", on_click=start_worklist, use_container_width=True)
+    with col_end:
+        st.button("⏹️ End", on_click=end_worklist, use_container_width=True,
+                  disabled=st.session_state.worklist is None)
 
 # ===================== LAYOUT =====================
 left, right = st.columns([1, 1.4])
@@ -491,38 +544,124 @@ with left:
     </div>
     """, unsafe_allow_html=True)
     
-    xray = st.file_uploader("📤 Upload X-ray Image", type=["jpg", "png", "jpeg"], key="xray_upload")
+    active_worklist = st.session_state.worklist
+    worklist_case = None
+    xray = None
+    xray_hash = None
+    ai_prediction = None
     
-    ai_component_html = None
-    show_ai_analysis = False
+    if active_worklist:
+        worklist_case = active_worklist.current()
+        xray_hash = worklist_case["input_hash"]
+        case_prediction = worklist_case["prediction"]
+        decision = active_worklist.decision()
+        
+        st.markdown(f"**📋 Case {active_worklist.index + 1} / {len(active_worklist)}: {worklist_case['study_id']}** "
+                    f"· {active_worklist.ready_ahead()} next case(s) ready")
+        col1, col2 = st.columns([1, 1])
+        with col1:
+            if worklist_case["image"] is not None:
+                st.image(worklist_case["image"], caption=worklist_case["study_id"], use_container_width=True)
+        with col2:
+            issues_md = "\n".join(f"- {issue}" for issue in worklist_case["quality"]["issues"])
+            if worklist_case["quality"]["status"] == "reject":
+                st.error(f"❌ **Rejected by quality check:**\n{issues_md}")
+            elif worklist_case["quality"]["status"] == "flag":
+                st.warning(f"⚠️ **Image quality warning:**\n{issues_md}")
+            if worklist_case["image"] is not None and worklist_case["error"]:
+                st.warning(f"⚠️ AI analysis unavailable: {worklist_case['error']}")
+            elif (worklist_case["image"] is not None and case_prediction is None
+                    and worklist_case["quality"]["status"] == "reject"):
+                st.button("⚠️ Analyze anyway (clinician override)", use_container_width=True,
+                          on_click=force_worklist_analysis)
+            
+            if case_prediction:
+                case_estimate = estimate_ai_bone_age(None, worklist_case, age)
+                ai_case_age = round(case_estimate["bone_age"], 1)
+                st.info(f"🤖 AI Bone Age: {ai_case_age:.1f} years "
+                        f"(90% range {case_estimate['lower']:.0f}–{case_estimate['upper']:.0f})")
+                st.button("✅ Confirm AI Bone Age", use_container_width=True, type="primary",
+                          on_click=decide_worklist, args=(ai_case_age, "ai"))
+            st.number_input("Override Bone Age (years)", 2.0, 19.0,
+                            float(min(max(decision["bone_age"] if decision else age, 2.0), 19.0)),
+                            step=0.1, key=f"worklist_override_{active_worklist.index}")
+            st.button("✏️ Save Override", use_container_width=True,
+                      on_click=override_worklist)
+            if decision:
+                st.success(f"Recorded: {decision['bone_age']:.1f} years "
+                           f"({'AI confirmed' if decision['source'] == 'ai' else 'override'})")
+        
+        col_prev, col_next = st.columns(2)
+        with col_prev:
+            st.button("⬅️ Previous", use_container_width=True, on_click=step_worklist, args=(-1,),
+                      disabled=active_worklist.index == 0)
+        with col_next:
+            st.button("Next ➡️", use_container_width=True, on_click=step_worklist, args=(1,),
+                      disabled=active_worklist.index == len(active_worklist) - 1)
+    else:
+        xray = st.file_uploader("📤 Upload X-ray Image", type=["jpg", "png", "jpeg"], key="xray_upload")
+    
+    memory = get_session_memory()
+    session_id = get_script_run_ctx().session_id
     
     if xray:
-        image = Image.open(xray)
-        
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        xray_hash = hashlib.sha256(xray.getvalue()).hexdigest()
+        image = memory.get_or_create(session_id, f"image:{xray_hash}", lambda: decode_xray(xray.getvalue()))
+        ai_prediction = st.session_state.ai_predictions.get(xray_hash)
             
         col1, col2 = st.columns([1, 1])
         with col1:
             st.image(image, caption="Uploaded X-ray Image", use_container_width=True)
         
         with col2:
-            if st.button("🔍 Analyze with AI", use_container_width=True, type="primary"):
-                show_ai_analysis = True
-                
-                # Convert image to base64
-                buffered = BytesIO()
-                image.save(buffered, format="JPEG")
-                img_str = base64.b64encode(buffered.getvalue()).decode()
-                image_data = f"data:image/jpeg;base64,{img_str}"
-                
-                ai_component_html = create_tm_html(image_data)
+            quality = check_xray_quality(xray.getvalue())
+            issues_md = "\n".join(f"- {issue}" for issue in quality["issues"])
+            quality_override = False
+            if quality["status"] == "reject":
+                st.error(f"❌ **Image rejected by quality check** — please upload a different X-ray:\n{issues_md}")
+                quality_override = st.checkbox("⚠️ Analyze anyway (clinician override)", key=f"quality_override_{xray_hash}")
+            elif quality["status"] == "flag":
+                st.warning(f"⚠️ **Image quality warning:**\n{issues_md}")
+            
+            if ai_prediction is None and (quality["status"] != "reject" or quality_override) and st.button("🔍 Analyze with AI", use_container_width=True, type="primary"):
+                st.session_state.pending_analysis = xray_hash
+                st.session_state.server_model_error = None  # every click retries the server model
+            
+            # The server model is the prediction of record: one forward pass gives the
+            # class, bone age and heatmap. The browser model only runs if it cannot load.
+            if (ai_prediction is None and st.session_state.pending_analysis == xray_hash
+                    and st.session_state.server_model_error is None):
+                try:
+                    with st.spinner("⏳ Analyzing X-ray..."):
+                        model_version, model = get_model_registry().current()
+                        server_result = analyze_xray(xray.getvalue(), model_version, model)
+                except MODEL_LOAD_ERRORS as error:
+                    st.session_state.server_model_error = f"{type(error).__name__}: {error}"
+                else:
+                    ai_prediction = server_prediction_record(server_result)
+                    remember_prediction(xray_hash, ai_prediction)
+                    st.session_state.pending_analysis = None
+            
+            if ai_prediction:
+                upload_estimate = estimate_ai_bone_age(ai_prediction, None, age)
+                st.success(f"✅ AI Bone Age: {upload_estimate['bone_age']:.1f} years "
+                           f"(90% range {upload_estimate['lower']:.0f}–{upload_estimate['upper']:.0f})")
+    
+    # Worklist cases show their result inline; this section is for uploads only
+    show_ai_analysis = xray is not None and (
+        ai_prediction is not None or st.session_state.pending_analysis == xray_hash
+    )
     
     st.markdown("---")
     
-    bone_age_known = st.checkbox("💡 Manual Bone Age Entry (if radiologist assessment available)")
+    ai_estimate = estimate_ai_bone_age(ai_prediction, worklist_case, age)
+    bone_age_known = st.checkbox("💡 Manual Bone Age Entry (if radiologist assessment available)", key="bone_age_known")
     if bone_age_known:
-        bone_age = st.number_input("Bone Age (years)", 2.0, 19.0, age, step=0.1)
+        if "manual_bone_age" not in st.session_state:
+            st.session_state.manual_bone_age = float(min(max(age, 2.0), 19.0))
+        bone_age = st.number_input("Bone Age (years)", 2.0, 19.0, step=0.1, key="manual_bone_age")
+    elif ai_estimate:
+        bone_age = ai_estimate["bone_age"]
     else:
         bone_age = age + (0.5 if secondary_count >= 2 else 0)
     
@@ -531,14 +670,68 @@ with left:
     st.markdown('</div>', unsafe_allow_html=True)
 
 # ===================== AI COMPONENT DISPLAY =====================
-if show_ai_analysis and ai_component_html:
+if show_ai_analysis:
     st.markdown('<hr class="divider-colorful">', unsafe_allow_html=True)
     st.markdown("""
     <div style="text-align: center; padding: 15px; background: linear-gradient(135deg, #f5f3ff 0%, #ede9fe 100%); border-radius: 12px; margin: 20px 0;">
         <h3 style="color: #6d28d9; margin: 0;">🤖 AI Analysis Results</h3>
     </div>
     """, unsafe_allow_html=True)
-    components.html(ai_component_html, height=700, scrolling=True)
+    
+    if ai_prediction is None:
+        st.warning(f"⚠️ Saliency heatmap unavailable: {st.session_state.server_model_error}. "
+                   "Falling back to the in-browser model.")
+        # Same key and args on every rerun, so the iframe is not reloaded
+        tfjs_version = get_model_registry().tfjs_version()
+        result = tm_bone_age(
+            image_data=memory.get_or_create(session_id, f"data_url:{xray_hash}", lambda: encode_image_data(image)),
+            model_url=f"models/{tfjs_version}/",
+            key=f"tm_{xray_hash}_{tfjs_version}",
+            default=None
+        )
+        if result:
+            remember_prediction(xray_hash, dict(result, model_version=tfjs_version, source="browser"))
+            get_analytics_log().log(
+                "analysis", source="browser", input_hash=xray_hash, model_version=tfjs_version,
+                probabilities=[item["probability"] for item in result["predictions"]]
+            )
+            st.session_state.pending_analysis = None
+            st.rerun()
+    else:
+        st.markdown(f"#### 🏆 Predicted Classification: {ai_prediction['maxClass']} "
+                    f"(Confidence Level: {ai_prediction['maxProb'] * 100:.1f}%)")
+        source = "Server" if ai_prediction.get("source") == "server" else "Browser"
+        st.caption(f"{source} model version {ai_prediction['model_version']}")
+        for item in ai_prediction["predictions"]:
+            st.progress(min(max(item["probability"], 0.0), 1.0),
+                        text=f"📊 {item['className']}: {item['probability'] * 100:.1f}%")
+    
+    # Saliency heatmap captured in the same forward pass as the prediction above
+    if ai_prediction is not None and ai_prediction.get("heatmap") is not None:
+        col_img, col_cam = st.columns(2)
+        with col_img:
+            st.image(image, caption="Uploaded X-ray Image", use_container_width=True)
+        with col_cam:
+            st.image(
+                bone_model.overlay_heatmap(image, ai_prediction["heatmap"]),
+                caption=f"Class activation map for class {ai_prediction['maxClass']} "
+                        f"({ai_prediction['maxProb'] * 100:.1f}%) · model {ai_prediction['model_version']}",
+                use_container_width=True
+            )
+        st.caption("🔥 Highlighted regions (e.g. growth plates) contributed most to the predicted bone age class.")
+        
+        # Most similar reference radiographs from the atlas
+        # Embeddings from another model version are not comparable, so the panel is hidden
+        atlas_index = get_atlas_index()
+        if atlas_index is not None and atlas_index["model_version"] == ai_prediction["model_version"]:
+            matches = atlas.query_index(atlas_index, ai_prediction["features"], k=5, gender=gender)
+            if matches:
+                st.markdown("### 📚 Similar Reference Radiographs")
+                match_cols = st.columns(len(matches))
+                for col, match in zip(match_cols, matches):
+                    with col:
+                        st.image(match["path"], use_container_width=True)
+                        st.caption(f"Bone age {match['bone_age']:.1f} yrs · similarity {match['similarity']:.2f}")
 
 # ===================== RESULT SECTION =====================
 with right:
@@ -551,7 +744,10 @@ with right:
         bmi = calculate_bmi(weight, height)
         height_perc = calculate_height_percentile(age, height)
         weight_perc = calculate_weight_percentile(age, weight)
-        bone_age_diff = bone_age - age
+        if ai_estimate and not bone_age_known:
+            bone_age_diff = ai_estimate["bone_age_diff"]
+        else:
+            bone_age_diff = bone_age - age
         
         # Calculate growth velocity if previous data available
         if has_previous and height_6m and weight_6m:
@@ -736,6 +932,7 @@ with right:
             
             plt.tight_layout()
             st.pyplot(fig_velocity)
+            plt.close(fig_velocity)
             
             # Clinical interpretation of growth velocity
             if accelerated:
@@ -800,6 +997,7 @@ with right:
         
         plt.title(f"Growth Chart - {gender}, Age {age:.1f} years", fontsize=14, fontweight='bold', pad=20)
         st.pyplot(fig)
+        plt.close(fig)
         
         st.divider()
         
@@ -824,11 +1022,16 @@ with right:
         - Assessment: {"⚠️ Accelerated Growth" if accelerated else "✅ Normal Growth Pattern"}
         """
         
+        if ai_estimate and not bone_age_known:
+            bone_age_range = f" (AI 90% range {ai_estimate['lower']:.0f}–{ai_estimate['upper']:.0f} years)"
+        else:
+            bone_age_range = ""
+        
         analysis_text += f"""
         
         **🦴 Skeletal Maturation Assessment:**
         - Chronological Age: {age:.1f} years ({st.session_state.age_text})
-        - Bone Age: {bone_age:.1f} years
+        - Bone Age: {bone_age:.1f} years{bone_age_range}
         - Bone Age Advancement: {bone_age_diff:+.1f} years
         
         **🔬 Sexual Maturation Status:**
@@ -846,6 +1049,23 @@ with right:
             if risk_level == "low":
                 risk_level = "medium"
         
+        if ai_prediction:
+            report_version = ai_prediction["model_version"]
+            report_probabilities = [item["probability"] for item in ai_prediction["predictions"]]
+        elif worklist_case and worklist_case["prediction"]:
+            report_version = worklist_case["prediction"]["model_version"]
+            report_probabilities = worklist_case["prediction"]["probabilities"]
+        else:
+            report_version, report_probabilities = None, None
+        get_analytics_log().log(
+            "report", source="report", input_hash=xray_hash,
+            model_version=report_version, probabilities=report_probabilities,
+            gender=gender, age=age, bone_age=bone_age, bone_age_diff=bone_age_diff,
+            height_percentile=height_perc, weight_percentile=weight_perc,
+            height_velocity=height_velocity, weight_velocity=weight_velocity,
+            risk_level=risk_level
+        )
+        
         st.markdown("### ⚕️ Clinical Risk Stratification")
         
         if risk_level == "high":
@@ -916,7 +1136,7 @@ with right:
         # Warning and disclaimer
         st.warning("⚠️ **Medical Disclaimer:** This screening tool is designed for educational purposes and preliminary assessment only. AI-based bone age evaluation provides supplementary information and cannot replace professional radiological interpretation or clinical judgment. All findings must be confirmed by qualified healthcare professionals. This system is not FDA-approved for diagnostic purposes and should not be used as the sole basis for clinical decision-making.")
         
-        if not bone_age_known and not xray:
+        if not bone_age_known and not xray_hash:
             st.info("💡 **Clinical Note:** Bone age estimation without radiographic assessment is approximate and based on clinical parameters. For accurate skeletal maturation assessment, hand/wrist radiography (Greulich-Pyle or Tanner-Whitehouse method) is recommended.")
         
         if not has_previous:
@@ -924,6 +1144,26 @@ with right:
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+# ===================== MEMORY USAGE =====================
+with st.sidebar.expander("🧠 Server Memory Usage"):
+    usage = memory.usage()
+    st.markdown(f"**Total:** {usage['total_bytes'] / 2**20:.1f} / {usage['global_budget'] / 2**20:.0f} MB "
+                f"· per-session budget {usage['per_session_budget'] / 2**20:.0f} MB "
+                f"· {usage['evictions']} evictions")
+    st.dataframe(
+        [
+            {
+                "Session": ("▶ " if s["session"] == session_id else "") + s["session"][:8],
+                "MB": round(s["bytes"] / 2**20, 2),
+                "Artifacts": s["artifacts"],
+                "Idle (min)": round(s["idle_seconds"] / 60, 1),
+            }
+            for s in usage["sessions"]
+        ],
+        use_container_width=True,
+        hide_index=True
+    )
+
 # ===================== FOOTER =====================
 st.markdown('<hr class="divider-colorful">', unsafe_allow_html=True)
 st.markdown("""
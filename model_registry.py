@@ -0,0 +1,263 @@
+"""Local, versioned registry for the bone-age model artifacts
+
+Two kinds of artifact are tracked:
+
+    keras  converted_keras.zip style (keras_model.h5 + labels.txt), used server-side
+    tfjs   Teachable Machine export (model.json + metadata.json + weights.bin),
+           served to the browser component from tm_component/models/<version>/
+
+Each zip is checksummed and extracted exactly once. registry.json records
+the versions and which one is active per kind; the running app watches it
+and swaps models without a restart:
+
+    python model_registry.py register converted_keras_finetuned.zip --activate
+    python model_registry.py activate keras <version>
+    python model_registry.py list
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from datetime import datetime
+import numpy as np
+
+import bone_model
+
+# ===================== LOCATIONS =====================
+REGISTRY_DIR = os.path.join(bone_model.BASE_DIR, ".model_registry")
+REGISTRY_FILE = os.path.join(REGISTRY_DIR, "registry.json")
+# tfjs files must live under the component folder so Streamlit serves them
+TFJS_DIR = os.path.join(bone_model.BASE_DIR, "tm_component", "models")
+BUNDLED_ZIPS = [
+    os.path.join(bone_model.BASE_DIR, "converted_keras.zip"),
+    os.path.join(bone_model.BASE_DIR, "โมเดลX-ray.zip"),
+]
+
+# ===================== REGISTRY FILE =====================
+def file_sha256(path):
+    """Streaming sha256 of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_registry():
+    """Current registry contents (empty registry if none exists yet)"""
+    if not os.path.exists(REGISTRY_FILE):
+        return {"active": {}, "versions": {}}
+    with open(REGISTRY_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+def write_registry(registry):
+    """Replace registry.json atomically so readers never see a partial file"""
+    os.makedirs(REGISTRY_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=REGISTRY_DIR, suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(registry, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, REGISTRY_FILE)
+
+def artifact_kind(zip_path):
+    """Return "keras" or "tfjs" depending on the files inside the archive"""
+    with zipfile.ZipFile(zip_path) as zf:
+        names = set(zf.namelist())
+    if "keras_model.h5" in names:
+        return "keras"
+    if "model.json" in names:
+        return "tfjs"
+    raise ValueError(f"{zip_path} is neither a Keras nor a Teachable Machine export")
+
+def version_dir(kind, version):
+    """Folder holding the extracted files of one version"""
+    root = TFJS_DIR if kind == "tfjs" else os.path.join(REGISTRY_DIR, "keras")
+    return os.path.join(root, version)
+
+def register(zip_path, activate=False):
+    """Checksum and extract a model zip once; returns its version id
+
+    The version id is the first 12 hex digits of the zip's sha256, so
+    registering the same archive twice is a no-op.
+    """
+    sha = file_sha256(zip_path)
+    version = sha[:12]
+    kind = artifact_kind(zip_path)
+    registry = read_registry()
+
+    if version not in registry["versions"]:
+        # Several processes may register the same zip at startup: each extracts into
+        # its own staging folder and the first rename wins. The content is keyed by
+        # sha, so a folder that is already in place is the same model.
+        target = version_dir(kind, version)
+        if not os.path.isdir(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            staging = tempfile.mkdtemp(dir=os.path.dirname(target), prefix=f"{version}.partial-")
+            with zipfile.ZipFile(zip_path) as zf:
+                zf.extractall(staging)
+            try:
+                os.replace(staging, target)
+            except OSError:
+                shutil.rmtree(staging, ignore_errors=True)
+                if not os.path.isdir(target):
+                    raise
+        registry["versions"][version] = {
+            "kind": kind,
+            "sha256": sha,
+            "source": os.path.basename(zip_path),
+            "registered_at": datetime.now().isoformat(timespec="seconds"),
+        }
+    if activate or kind not in registry["active"]:
+        registry["active"][kind] = version
+    write_registry(registry)
+    return version
+
+def activate_version(kind, version):
+    """Point every session at another registered version"""
+    registry = read_registry()
+    if registry["versions"].get(version, {}).get("kind") != kind:
+        raise KeyError(f"No registered {kind} model with version {version}")
+    registry["active"][kind] = version
+    write_registry(registry)
+
+def ensure_bundled():
+    """Register the zips shipped with the repo (a no-op for unchanged zips)
+
+    An updated bundled zip becomes active only if the active version came
+    from that same bundled file, so an explicitly activated fine-tuned
+    model is never replaced behind the operator's back.
+    """
+    for zip_path in BUNDLED_ZIPS:
+        registry = read_registry()
+        active = registry["active"].get(artifact_kind(zip_path))
+        follows_bundle = active is None or registry["versions"][active]["source"] == os.path.basename(zip_path)
+        register(zip_path, activate=follows_bundle)
+    return read_registry()
+
+def active_model_dir(kind="keras"):
+    """(version, folder) of the active version of one kind"""
+    version = ensure_bundled()["active"][kind]
+    return version, version_dir(kind, version)
+
+def load_active():
+    """(version, model) of the active keras model, for offline tools"""
+    version, model_dir = active_model_dir("keras")
+    return version, bone_model.load_model(model_dir)
+
+# ===================== HOT SWAP =====================
+class ModelRegistry:
+    """Process-wide view of the active models with background warm-up
+
+    `current()` is cheap: it stats registry.json and returns the
+    (version, model) pair that is fully loaded. The active model starts
+    warming on a background thread as soon as the registry is created,
+    and when the active keras version changes the new model is loaded the
+    same way and swapped in with a single assignment once it is ready.
+    Loading never holds the lock, so other sessions are never blocked by
+    it; only a caller that needs the model before the first load has
+    finished waits for it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._registry = ensure_bundled()
+        self._mtime = os.stat(REGISTRY_FILE).st_mtime_ns
+        self._warming = None
+        self._current = None
+        self._error = None              # why the last load failed while nothing is loaded
+        self._ready = threading.Event()  # set once a load attempt has finished
+        with self._lock:
+            self._start_warm(self._registry["active"]["keras"])
+
+    def _start_warm(self, version):
+        """Load a version on a background thread (lock held)"""
+        self._warming = version
+        if self._current is None:
+            self._ready.clear()
+        threading.Thread(target=self._warm, args=(version,), daemon=True).start()
+
+    def _refresh(self):
+        """Reload registry.json if it changed and start warming a new version"""
+        try:
+            mtime = os.stat(REGISTRY_FILE).st_mtime_ns
+        except OSError:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            self._registry = read_registry()
+            wanted = self._registry["active"].get("keras")
+            loaded = self._current[0] if self._current else None
+            if wanted and wanted != loaded and wanted != self._warming:
+                self._start_warm(wanted)
+
+    def _warm(self, version):
+        """Load a version off the request path, then swap it in atomically"""
+        try:
+            model = bone_model.load_model(version_dir("keras", version))
+            # Run one dummy batch so the first clinician does not pay graph tracing
+            size = bone_model.IMAGE_SIZE
+            bone_model.predict_batch(model, np.zeros((1, size, size, 3), dtype=np.float32))
+        except Exception as error:
+            with self._lock:
+                if self._warming == version:
+                    self._warming = None
+                if self._current is None:
+                    self._error = error
+                    self._ready.set()
+            return
+        with self._lock:
+            # Until something is loaded, any version beats none; _refresh warms the active one next
+            if self._current is None or self._registry["active"].get("keras") == version:
+                self._current = (version, model)
+                self._error = None
+            if self._warming == version:
+                self._warming = None
+            self._ready.set()
+
+    def current(self):
+        """(version, model) of the active, fully warmed keras model
+
+        Waits only while the first load of this process is still running.
+        If that load failed, its error is raised and the next call retries.
+        """
+        self._refresh()
+        with self._lock:
+            if self._current is None and self._warming is None:
+                self._start_warm(self._registry["active"]["keras"])
+        self._ready.wait()
+        with self._lock:
+            if self._current is None:
+                raise self._error
+            return self._current
+
+    def tfjs_version(self):
+        """Active browser model version (served from tm_component/models/)"""
+        self._refresh()
+        return self._registry["active"].get("tfjs")
+
+# ===================== CLI =====================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage local bone-age model versions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    reg = sub.add_parser("register", help="checksum, extract and record a model zip")
+    reg.add_argument("zip_path")
+    reg.add_argument("--activate", action="store_true", help="switch all sessions to it")
+    act = sub.add_parser("activate", help="switch all sessions to a registered version")
+    act.add_argument("kind", choices=["keras", "tfjs"])
+    act.add_argument("version")
+    sub.add_parser("list", help="show registered versions")
+    args = parser.parse_args()
+
+    if args.command == "register":
+        print(register(args.zip_path, args.activate))
+    elif args.command == "activate":
+        activate_version(args.kind, args.version)
+    else:
+        registry = ensure_bundled()
+        for version, info in registry["versions"].items():
+            marker = "*" if registry["active"].get(info["kind"]) == version else " "
+            print(f"{marker} {info['kind']:<5} {version}  {info['source']}  {info['registered_at']}")
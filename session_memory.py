@@ -0,0 +1,207 @@
+"""Bounded per-session storage for large artifacts (decoded X-rays, data URLs, worklist cases)
+
+Streamlit keeps a session alive as long as its tab is open, so anything a
+session caches lives all day. Large artifacts go through SessionMemory
+instead of st.session_state. It enforces a per-session and a global
+byte budget with LRU eviction, drops artifacts of idle or closed sessions
+(an idle tab only loses cached artifacts; a closed tab is released and
+its callbacks run, e.g. to stop a worklist's threads), and reports
+current usage per session.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+# ===================== BUDGETS =====================
+PER_SESSION_BYTES = 64 * 2**20
+GLOBAL_BYTES = 1024 * 2**20
+IDLE_SECONDS = 15 * 60
+SWEEP_SECONDS = 60
+
+# ===================== SIZE ESTIMATE =====================
+def estimate_size(obj):
+    """Approximate in-memory size of an artifact in bytes"""
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, Image.Image):
+        return obj.width * obj.height * len(obj.getbands())
+    if isinstance(obj, (bytes, bytearray, str)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(estimate_size(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_size(v) for v in obj)
+    return sys.getsizeof(obj)
+
+# ===================== STORE =====================
+class SessionMemory:
+    """Process-wide LRU store of large artifacts, accounted per session"""
+
+    def __init__(self, per_session_bytes=PER_SESSION_BYTES, global_bytes=GLOBAL_BYTES,
+                 idle_seconds=IDLE_SECONDS, is_active=None):
+        self.per_session_bytes = per_session_bytes
+        self.global_bytes = global_bytes
+        self.idle_seconds = idle_seconds
+        self.is_active = is_active  # callable(session_id) -> bool, optional
+        self._lock = threading.Lock()
+        self._items = OrderedDict()   # (session_id, name) -> [obj, nbytes, last_access], LRU first
+        self._session_bytes = {}
+        self._last_seen = {}
+        self._on_release = {}         # session_id -> {name: callback}, run when the session is released
+        self._pinned = set()          # keys budget enforcement never evicts (e.g. the case on screen)
+        self.evictions = 0
+        threading.Thread(target=self._sweep_forever, daemon=True).start()
+
+    def _remove(self, key):
+        """Remove one artifact and update the accounting (lock held)"""
+        _, nbytes, _ = self._items.pop(key)
+        session_id = key[0]
+        self._session_bytes[session_id] -= nbytes
+        if not any(k[0] == session_id for k in self._items):
+            self._session_bytes.pop(session_id, None)
+
+    def _enforce(self, session_id):
+        """Evict least recently used artifacts until both budgets hold (lock held)"""
+        for key in [k for k in self._items if k[0] == session_id and k not in self._pinned]:
+            if self._session_bytes.get(session_id, 0) <= self.per_session_bytes:
+                break
+            self._remove(key)
+            self.evictions += 1
+        while sum(self._session_bytes.values()) > self.global_bytes:
+            key = next((k for k in self._items if k not in self._pinned), None)
+            if key is None:
+                break
+            self._remove(key)
+            self.evictions += 1
+
+    def get_or_create(self, session_id, name, factory):
+        """Return a stored artifact, building and storing it on a miss"""
+        key = (session_id, name)
+        now = time.monotonic()
+        with self._lock:
+            self._last_seen[session_id] = now
+            if key in self._items:
+                self._items.move_to_end(key)
+                self._items[key][2] = now
+                return self._items[key][0]
+
+        obj = factory()
+        nbytes = estimate_size(obj)
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+            self._items[key] = [obj, nbytes, now]
+            self._session_bytes[session_id] = self._session_bytes.get(session_id, 0) + nbytes
+            self._enforce(session_id)
+        return obj
+
+    def pin(self, session_id, name, pinned=True):
+        """Exempt an artifact (stored now or later) from budget eviction, or lift that
+
+        Idle and closed-session sweeps still drop pinned artifacts.
+        """
+        with self._lock:
+            if pinned:
+                self._pinned.add((session_id, name))
+            else:
+                self._pinned.discard((session_id, name))
+
+    def discard(self, session_id, name):
+        """Drop one artifact if it is stored"""
+        with self._lock:
+            if (session_id, name) in self._items:
+                self._remove((session_id, name))
+
+    def on_release(self, session_id, name, callback):
+        """Run callback() when the session is released, e.g. to stop its threads
+
+        Registering the same name again replaces the callback; None removes it.
+        """
+        with self._lock:
+            if callback is None:
+                self._on_release.get(session_id, {}).pop(name, None)
+            else:
+                self._last_seen.setdefault(session_id, time.monotonic())
+                self._on_release.setdefault(session_id, {})[name] = callback
+
+    def _drop_artifacts(self, session_id):
+        """Remove every artifact of a session (lock held); returns how many"""
+        keys = [k for k in self._items if k[0] == session_id]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def evict_session(self, session_id):
+        """Drop a session's cached artifacts but keep it registered
+
+        Used for idle tabs that are still open: everything stored here can
+        be rebuilt on the next rerun, and release callbacks do not run.
+        """
+        with self._lock:
+            freed = self._drop_artifacts(session_id)
+            if session_id not in self._on_release:
+                self._last_seen.pop(session_id, None)
+        return freed
+
+    def release_session(self, session_id):
+        """Drop everything a session holds and run its release callbacks"""
+        with self._lock:
+            freed = self._drop_artifacts(session_id)
+            self._last_seen.pop(session_id, None)
+            self._pinned = {k for k in self._pinned if k[0] != session_id}
+            callbacks = self._on_release.pop(session_id, {})
+        for callback in callbacks.values():
+            callback()
+        return freed
+
+    def sweep(self):
+        """Release sessions that have closed and evict artifacts of idle ones"""
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            sessions = list(self._last_seen)
+        for session_id in sessions:
+            if self.is_active is not None and not self.is_active(session_id):
+                freed = self.release_session(session_id)
+            elif self._last_seen.get(session_id, cutoff) < cutoff:
+                freed = self.evict_session(session_id)
+            else:
+                continue
+            with self._lock:
+                self.evictions += freed
+
+    def _sweep_forever(self):
+        """Background sweep so idle tabs are trimmed even without traffic"""
+        while True:
+            time.sleep(SWEEP_SECONDS)
+            try:
+                self.sweep()
+            except Exception:
+                pass
+
+    def usage(self):
+        """Per-session readout: bytes held, artifact count, seconds idle"""
+        now = time.monotonic()
+        with self._lock:
+            counts = {}
+            for session_id, _ in self._items:
+                counts[session_id] = counts.get(session_id, 0) + 1
+            sessions = [
+                {
+                    "session": session_id,
+                    "bytes": nbytes,
+                    "artifacts": counts.get(session_id, 0),
+                    "idle_seconds": now - self._last_seen.get(session_id, now),
+                }
+                for session_id, nbytes in self._session_bytes.items()
+            ]
+            total = sum(self._session_bytes.values())
+        return {
+            "total_bytes": total,
+            "global_budget": self.global_bytes,
+            "per_session_budget": self.per_session_bytes,
+            "evictions": self.evictions,
+            "sessions": sorted(sessions, key=lambda s: -s["bytes"]),
+        }
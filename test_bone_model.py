@@ -0,0 +1,60 @@
+"""Unit tests for the bone-age estimate (numpy only, no TensorFlow needed)
+
+    python -m pytest -q test_bone_model.py
+"""
+import numpy as np
+import pytest
+from PIL import Image
+
+import bone_model
+
+AGES = np.array([5.0, 6.0, 7.0], dtype=np.float32)
+
+def fake_model(seed=0, labels=("5", "6", "7")):
+    """Tiny stand-in for load_model(): random conv activations and head weights"""
+    rng = np.random.default_rng(seed)
+    activations = rng.random((7, 7, 4), dtype=np.float32)
+    return {
+        "conv": lambda images, training=False: np.stack([activations * (i + 1) for i in range(len(images))]),
+        "w1": rng.standard_normal((4, 8)).astype(np.float32),
+        "b1": rng.standard_normal(8).astype(np.float32),
+        "w2": rng.standard_normal((8, len(labels))).astype(np.float32),
+        "labels": list(labels),
+    }
+
+def test_expected_value_and_interval():
+    estimate = bone_model.estimate_bone_age([0.02, 0.96, 0.02], chronological_age=5.5, class_ages=AGES)
+    assert estimate["bone_age"] == pytest.approx(6.0)
+    assert estimate["bone_age_diff"] == pytest.approx(0.5)
+    assert (estimate["lower"], estimate["upper"]) == (6.0, 6.0)
+
+    wide = bone_model.estimate_bone_age([0.1, 0.8, 0.1], class_ages=AGES)
+    assert wide["bone_age"] == pytest.approx(6.0)
+    assert wide["std"] == pytest.approx(np.sqrt(0.2), rel=1e-5)
+    assert (wide["lower"], wide["upper"]) == (5.0, 7.0)
+    assert wide["bone_age_diff"] is None
+
+def test_single_and_batch_shapes_agree():
+    probs = np.array([[0.7, 0.2, 0.1], [0.1, 0.2, 0.7]], dtype=np.float32)
+    batch = bone_model.estimate_bone_age(probs, class_ages=AGES)
+    for key in ("bone_age", "std", "lower", "upper"):
+        assert batch[key].shape == (2,)
+    for row, p in enumerate(probs):
+        single = bone_model.estimate_bone_age(p, class_ages=AGES)
+        assert isinstance(single["bone_age"], float)
+        assert single["bone_age"] == pytest.approx(float(batch["bone_age"][row]))
+        assert (single["lower"], single["upper"]) == (batch["lower"][row], batch["upper"][row])
+
+def test_predict_batch_carries_the_estimate():
+    model = fake_model()
+    images = np.zeros((3, bone_model.IMAGE_SIZE, bone_model.IMAGE_SIZE, 3), dtype=np.float32)
+    result = bone_model.predict_batch(model, images)
+    expected = bone_model.estimate_bone_age(result["probabilities"], class_ages=AGES)
+    assert result["bone_age"].shape == (3,)
+    np.testing.assert_allclose(result["bone_age"], expected["bone_age"])
+    np.testing.assert_array_equal(result["bone_age_lower"], expected["lower"])
+    np.testing.assert_array_equal(result["bone_age_upper"], expected["upper"])
+
+    single = bone_model.predict_image(model, Image.new("L", (300, 400)))
+    assert single["bone_age"] == pytest.approx(float(result["bone_age"][0]))
+    assert single["bone_age_lower"] == float(result["bone_age_lower"][0])
@@ -0,0 +1,207 @@
+"""Radiologist worklist with background prefetch
+
+Studies are queued from a folder or a list of uploads and reviewed one at
+a time. While the current study is on screen, the next few are decoded,
+quality-checked and run through the server-side model on a small thread
+pool, so stepping to the next case never waits on analysis. Analyzed
+cases (a display-sized copy of the image plus the prediction) are held
+in the session's SessionMemory budget, and only a short window around the
+cursor is kept there.
+"""
+import hashlib
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from PIL import Image, UnidentifiedImageError
+
+import bone_model
+import image_quality
+
+# ===================== SETTINGS =====================
+PREFETCH = 3        # studies analyzed ahead of the cursor
+KEEP_BEHIND = 1     # analyzed studies kept behind the cursor (for "previous")
+WORKERS = 2
+DISPLAY_SIDE = 1024  # px, longest side of the image kept with an analyzed case
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# Missing TensorFlow, or a Keras that cannot deserialize the h5, fails per study
+MODEL_ERRORS = (ImportError, OSError, ValueError, TypeError)
+
+# ===================== STUDY SOURCES =====================
+def read_file(path):
+    """Raw bytes of a study file"""
+    with open(path, "rb") as f:
+        return f.read()
+
+def folder_studies(folder):
+    """(study id, loader) pairs for every image in a server-side folder"""
+    names = sorted(n for n in os.listdir(folder) if n.lower().endswith(IMAGE_EXTENSIONS))
+    return [(name, partial(read_file, os.path.join(folder, name))) for name in names]
+
+def upload_studies(uploaded_files):
+    """(study id, loader) pairs for Streamlit UploadedFile objects"""
+    return [(f.name, f.getvalue) for f in uploaded_files]
+
+# ===================== ANALYSIS =====================
+def analyze_study(study_id, loader, registry, log=None, force=False):
+    """Decode, quality-check and (if usable) predict one study
+
+    Never raises: an unreadable file comes back as a rejected case with no
+    image, and a model that cannot load leaves `prediction` None with the
+    reason in `error`, so one bad study does not stop the worklist. The
+    case keeps only a DISPLAY_SIDE copy of the film; the full-resolution
+    bitmap is dropped once it has been checked and predicted.
+    `force` runs the model on a quality-rejected image (clinician override).
+    `log(event, **fields)` is called once per prediction made.
+    """
+    case = {"study_id": study_id, "input_hash": None, "image": None,
+            "quality": None, "prediction": None, "error": None}
+    try:
+        image_bytes = loader()
+        case["input_hash"] = hashlib.sha256(image_bytes).hexdigest()
+        image = Image.open(BytesIO(image_bytes))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.load()
+    except (OSError, UnidentifiedImageError) as error:
+        case["error"] = f"{type(error).__name__}: {error}"
+        case["quality"] = {"status": "reject", "issues": [f"Could not read image ({case['error']})"], "metrics": {}}
+        return case
+    case["image"] = image.copy()
+    case["image"].thumbnail((DISPLAY_SIDE, DISPLAY_SIDE), Image.Resampling.LANCZOS)
+    case["quality"] = image_quality.check_image_quality(image)
+    if case["quality"]["status"] == "reject" and not force:
+        return case
+    try:
+        model_version, model = registry.current()
+        case["prediction"] = dict(bone_model.predict_image(model, image), model_version=model_version)
+    except MODEL_ERRORS as error:
+        case["error"] = f"{type(error).__name__}: {error}"
+        return case
+    if log is not None:
+        log("analysis", source="worklist", input_hash=case["input_hash"], model_version=model_version,
+            probabilities=case["prediction"]["probabilities"])
+    return case
+
+# ===================== WORKLIST =====================
+_worklist_ids = itertools.count()
+
+class Worklist:
+    """Cursor over queued studies with prefetching and per-case decisions
+
+    Cases live in `memory` (a SessionMemory) under this session's budget;
+    the futures only signal completion. The case at the cursor is pinned,
+    so prefetching never evicts it; a case evicted otherwise (or dropped
+    while the tab was idle) is analyzed again when it is next shown, and
+    is logged only the first time.
+    """
+
+    def __init__(self, studies, registry, memory, session_id, prefetch=PREFETCH, log=None):
+        self.studies = studies
+        self.registry = registry
+        self.memory = memory
+        self.session_id = session_id
+        self.prefetch = prefetch
+        self.log = log
+        self.index = 0
+        self.closed = False
+        self.decisions = {}   # study index -> {"bone_age": float, "source": "ai" | "override"}
+        self.forced = set()   # study indices analyzed despite a quality reject
+        self._name = f"worklist-{next(_worklist_ids)}"
+        self._pinned = None
+        self._logged = set()  # case names whose analysis was already logged
+        self._futures = {}
+        self._executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="worklist")
+        memory.on_release(session_id, self._name, self.close)
+        self._schedule()
+
+    def __len__(self):
+        return len(self.studies)
+
+    def _case_name(self, i):
+        """SessionMemory name of one analyzed case (forced runs are kept apart)"""
+        return f"{self._name}:{i}:{'forced' if i in self.forced else 'auto'}"
+
+    def _analyze(self, i):
+        """Analyze study i into SessionMemory (or return it if already there)"""
+        study_id, loader = self.studies[i]
+        name = self._case_name(i)
+        log = None if name in self._logged else self.log
+        case = self.memory.get_or_create(
+            self.session_id, name,
+            partial(analyze_study, study_id, loader, self.registry, log, i in self.forced)
+        )
+        if case["prediction"] is not None:
+            self._logged.add(name)
+        return case
+
+    def _prefetch(self, i):
+        """Background task: the case itself stays in SessionMemory, not in the future"""
+        if not self.closed:
+            self._analyze(i)
+
+    def _schedule(self):
+        """Prefetch the window ahead of the cursor and forget results behind it"""
+        cursor = self._case_name(self.index)
+        if cursor != self._pinned:
+            if self._pinned is not None:
+                self.memory.pin(self.session_id, self._pinned, False)
+            self.memory.pin(self.session_id, cursor)
+            self._pinned = cursor
+        for i in list(self._futures):
+            if i < self.index - KEEP_BEHIND or i > self.index + self.prefetch:
+                self._futures.pop(i).cancel()
+                self.memory.discard(self.session_id, self._case_name(i))
+        for i in range(self.index, min(len(self.studies), self.index + self.prefetch + 1)):
+            if i not in self._futures:
+                self._futures[i] = self._executor.submit(self._prefetch, i)
+
+    def current(self):
+        """The analyzed current case (blocks only if prefetch has not caught up)"""
+        if self.index not in self._futures:
+            self._schedule()
+        self._futures[self.index].result()
+        return self._analyze(self.index)
+
+    def force_analysis(self):
+        """Run the model on the current case even though quality rejected it"""
+        self.memory.discard(self.session_id, self._case_name(self.index))
+        self.forced.add(self.index)
+        self._futures.pop(self.index).cancel()
+        self._schedule()
+
+    def go_to(self, index):
+        """Move the cursor and refill the prefetch window"""
+        self.index = min(max(index, 0), len(self.studies) - 1)
+        self._schedule()
+
+    def ready_ahead(self):
+        """How many upcoming cases are already analyzed"""
+        return sum(1 for i, f in self._futures.items() if i > self.index and f.done())
+
+    def decide(self, bone_age, source):
+        """Record the confirmed or overridden bone age for the current case"""
+        self.decisions[self.index] = {"bone_age": float(bone_age), "source": source}
+
+    def decision(self):
+        """Decision for the current case, if any"""
+        return self.decisions.get(self.index)
+
+    def close(self):
+        """Stop background work and free the cached cases and study sources
+
+        Also runs when SessionMemory releases a disconnected session.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for i, future in self._futures.items():
+            future.cancel()
+            self.memory.discard(self.session_id, self._case_name(i))
+        self._futures.clear()
+        self._executor.shutdown(wait=False)
+        if self._pinned is not None:
+            self.memory.pin(self.session_id, self._pinned, False)
+        self.memory.on_release(self.session_id, self._name, None)
+        self.studies = []